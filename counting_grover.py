@@ -1,64 +1,72 @@
 from __future__ import annotations
 import os
 import math
-from typing import Dict, List, Tuple
+from functools import lru_cache
+from typing import Optional
 
-from rich.progress import track
-from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister, transpile
-from qiskit.circuit.library import MCXGate
-from qiskit_aer import Aer
+import numpy as np
 
-from oracle import makeOracle
+from qiskit import QuantumCircuit, QuantumRegister, transpile
+from qiskit.circuit import Gate
+from qiskit.circuit.library import CCZGate, CZGate, MCXGate, QFTGate
+from qiskit_aer import AerSimulator
 
-def int_to_bits_le(n: int, width: int) -> List[int]:
-    """Little-endian list [b0..b_{width-1}] with b0 as LSB to match IBM format"""
-    return [(n >> i) & 1 for i in range(width)]
+from oracle import SPEC_K, makeOracle
 
-def estimate_K_classical(oracle: QuantumCircuit, n_data: int, log_file) -> int:
+# small MCZs as single gates Aer runs natively, instead of H·MCX·H
+MCZ_GATES = {2: CZGate, 3: CCZGate}
+
+def progress(iterable, description: str):
+    """
+    rich progress bar only when QIS_PROGRESS is set; by default the plain
+    iterable, so hot loops skip the per-iteration terminal updates
+    """
+    if os.environ.get("QIS_PROGRESS"):
+        from rich.progress import track
+        return track(iterable, description=description)
+    return iterable
+
+
+def estimate_K_classical(oracle: QuantumCircuit | Gate, n_data: int, log_file) -> int:
     """
     count exactly how many z in {0,1}^n cause a phase flip (spec(z)=1)
-    Uses statevector simulator and inspect the ancilla=0 slice amplitude sign
+    Uses one unitary simulator run and inspects the sign of the diagonal
+    entries of the (diagonal) phase oracle
     """
     N = 1 << n_data
-    backend = Aer.get_backend("statevector_simulator")
-    K = 0
-
-    desc = f"[K] enumerate {N} basis inputs"
-    for z in track(range(N), description=desc):
-        # Prepare |z> on data, ancilla remains |0>
-        qc = QuantumCircuit(n_data + 1)
-        bits_le = int_to_bits_le(z, n_data)  # [z0,z1,...,z_{n-1}]
-        for i, bit in enumerate(bits_le):
-            if bit == 1:
-                # apply x to if 1
-                qc.x(i)
-
-        # add in the oracle
-        qc.compose(oracle, inplace=True)
-
-        # get psi vector of final state
-        sv = backend.run(transpile(qc, backend)).result().get_statevector(qc)
-
-        # Qiskit index format 
-        idx = z
-        # get amplitude of |z> in final state
-        amp = sv[idx].real
-        unsafe = (amp < -0.5)
-        if unsafe:
-            K += 1
-
-        # log each z with its amp and safety
-        z_str = "".join(str(b) for b in reversed(bits_le))
-        log_file.write(
-            f"[K] z={z_str}  amp≈{amp:+.3f}  {'UNSAFE(-)' if unsafe else 'safe(+)' }\n"
-        )
+    # single precision is plenty to read a ±1 sign
+    backend = AerSimulator(method="unitary", precision="single")
+
+    qc = QuantumCircuit(n_data)
+    qc.compose(oracle, inplace=True)
+    qc.save_unitary()
+
+    # single run gives <z|O|z> for every z at once
+    tqc = transpile(qc, backend, optimization_level=0)
+    U = np.asarray(backend.run(tqc).result().get_unitary(qc))
+
+    idx = np.arange(N)
+    diag = U[idx, idx].real
+    unsafe = diag < -0.5
+    K = int(np.count_nonzero(unsafe))
+
+    # msb->lsb strings (z_{n-1}..z0), built once for the log
+    z_strs = [format(z, f"0{n_data}b") for z in range(N)]
+
+    # log each z with its amp and safety, written in one call
+    log_file.writelines(
+        f"[K] z={z_strs[z]}  amp≈{diag[z]:+.3f}  "
+        f"{'UNSAFE(-)' if unsafe[z] else 'safe(+)' }\n"
+        for z in range(N)
+    )
 
     return K
 
 def make_diffuser(n_data: int) -> QuantumCircuit:
     """
     Grover diffuser on n_data qubits: H^⊗ X^⊗ (multi-controlled Z) X^⊗ H^⊗
-    MCZ is implemented by H on target, MCX, then H back
+    MCZ is a native CZ/CCZ for n_data 2-3 (see MCZ_GATES), otherwise
+    H on target, MCX, then H back
     """
     if n_data < 1:
         raise ValueError("n_data must be >= 1")
@@ -77,13 +85,16 @@ def make_diffuser(n_data: int) -> QuantumCircuit:
     target = n_data - 1
     controls = list(range(n_data - 1))
 
-    diff.h(target)
-    if n_data == 1:
-        diff.z(target)  # reflection about |0> for 1 qubit
+    if n_data in MCZ_GATES:
+        diff.append(MCZ_GATES[n_data](), controls + [target])
     else:
-        mcx = MCXGate(len(controls))
-        diff.append(mcx, controls + [target])
-    diff.h(target)
+        diff.h(target)
+        if n_data == 1:
+            diff.z(target)  # reflection about |0> for 1 qubit
+        else:
+            mcx = MCXGate(len(controls))
+            diff.append(mcx, controls + [target])
+        diff.h(target)
 
     # uncompute X then H
     for i in range(n_data):
@@ -94,16 +105,113 @@ def make_diffuser(n_data: int) -> QuantumCircuit:
     return diff
 
 
+@lru_cache(maxsize=None)
+def cached_diffuser(n_data: int) -> Gate:
+    """make_diffuser(n_data) lowered for Aer once and reused as a gate"""
+    return transpile(make_diffuser(n_data), AerSimulator(), optimization_level=0).to_gate()
+
+
+@lru_cache(maxsize=None)
+def cached_oracle() -> Gate:
+    """makeOracle() lowered for Aer once and reused as a gate"""
+    return transpile(makeOracle(), AerSimulator(), optimization_level=0).to_gate()
+
+
+def make_grover_iterate(oracle: QuantumCircuit | Gate, n_data: int) -> QuantumCircuit:
+    """Grover iterate G = Us·O on n_data qubits"""
+    iterate = QuantumCircuit(n_data, name="G")
+    iterate.compose(oracle, inplace=True)
+    iterate.append(cached_diffuser(n_data), range(n_data))
+    return iterate
+
+
+def estimate_K_quantum(
+    oracle: QuantumCircuit | Gate,
+    n_data: int,
+    log_file,
+    n_count: Optional[int] = None,
+) -> int:
+    """
+    Quantum Counting: phase estimation of the Grover iterate G
+    Our diffuser is -(2|s><s| - I), so G has eigenphases π ± θ with
+    sin²(θ/2) = K/N, and K = N·cos²(θ_m/2) for the measured phase θ_m
+    n_count counting qubits cost 2^n_count - 1 oracle calls; the default
+    n_data//2 + 4 keeps that O(√N) instead of the N of the classical count
+    (raise n_count if K must be exact for larger N)
+    """
+    N = 1 << n_data
+    if n_count is None:
+        n_count = n_data // 2 + 4
+    T = 1 << n_count
+
+    qr_count = QuantumRegister(n_count, "c")
+    qr_data = QuantumRegister(n_data, "d")
+    qc = QuantumCircuit(qr_count, qr_data, name="QCount")
+    qc.h(qr_count)
+    qc.h(qr_data)
+
+    cG = make_grover_iterate(oracle, n_data).to_gate().control()
+    for j in range(n_count):
+        for _ in range(1 << j):
+            qc.append(cG, [qr_count[j], *qr_data])
+    qc.append(QFTGate(n_count).inverse(), qr_count)
+    # Aer marginalizes onto the counting register; no statevector copy
+    qc.save_probabilities_dict(qr_count, label="p")
+
+    backend = make_grover_backend()
+    tqc = transpile(qc, backend, optimization_level=0)
+    probs = backend.run(tqc).result().data(0)["p"]
+    y = max(probs, key=probs.get)
+    theta = 2.0 * math.pi * y / T
+    K = int(round(N * math.cos(theta / 2.0) ** 2))
+
+    log_file.write(
+        f"[K] quantum counting t={n_count} y={y} p={probs[y]:.3f} "
+        f"oracle calls={T - 1} K={K}\n"
+    )
+    return K
+
+
+def top_k(arr: np.ndarray, k: int = 8) -> np.ndarray:
+    """
+    Indices of the k largest nonzero counts, largest first
+    Uses argpartition instead of sorting all N
+    """
+    k = min(k, len(arr))
+    idx = np.argpartition(-arr, k - 1)[:k]
+    idx = idx[np.argsort(-arr[idx], kind="stable")]
+    return idx[arr[idx] > 0]
+
+
+def make_grover_backend() -> AerSimulator:
+    """
+    CPU AerSimulator by default; with QIS_USE_GPU=1 try a cuStateVec GPU
+    statevector backend and fall back to CPU if no GPU is available
+    """
+    cpu = AerSimulator(method="automatic", precision="single")
+    if os.environ.get("QIS_USE_GPU") == "1" and "GPU" in cpu.available_devices():
+        return AerSimulator(
+            method="statevector",
+            device="GPU",
+            precision="single",
+            cuStateVec_enable=True,
+        )
+    return cpu
+
+
 def grover_search(
-    oracle: QuantumCircuit,
+    oracle: QuantumCircuit | Gate,
     n_data: int,
     K: int,
     shots: int,
     log_file,
-) -> Dict[str, int]:
+) -> np.ndarray:
     """
     Run Grover for r = floor((π/4)*sqrt(N/K)) iterations
-    Returns counts dict over data bitstrings (msb->lsb)
+    Computes the final probabilities once with Aer's
+    save_probabilities_dict and scales them by shots
+    Returns a dense int64[N] counts array indexed by z (the integer value
+    of the data bitstring), the expected value of a shot-based run
     """
     if K <= 0:
         raise ValueError("K must be >= 1 for Grover search.")
@@ -111,52 +219,66 @@ def grover_search(
     r = max(1, int(math.floor((math.pi / 4.0) * math.sqrt(N / K))))
 
     qr_data = QuantumRegister(n_data, "d")
-    qr_anc = QuantumRegister(1, "a")
-    cr = ClassicalRegister(n_data, "cd")
-    qc = QuantumCircuit(qr_data, qr_anc, cr, name="Grover")
+    qc = QuantumCircuit(qr_data, name="Grover")
 
-    # Init data to uniform superposition; ancilla stays |0>
+    # Init data to uniform superposition
     for i in range(n_data):
         qc.h(qr_data[i])
 
-    diffuser = make_diffuser(n_data)
+    backend = make_grover_backend()
 
-    desc = f"[Grover] r={r} iterations"
-    for _ in track(range(r), description=desc):
-        # Append oracle over [data..., ancilla]
-        qc.compose(oracle, qubits=[*qr_data, qr_anc[0]], inplace=True)
-        # Diffuser over data only
-        qc.compose(diffuser, qubits=qr_data, inplace=True)
-
-    # measure data only
-    for i in range(n_data):
-        qc.measure(qr_data[i], cr[i])
+    # build the Grover iterate G = Us·O once, append it r times
+    iterate = make_grover_iterate(oracle, n_data)
+    G = transpile(iterate, backend, optimization_level=0).to_instruction()
 
-    backend = Aer.get_backend("qasm_simulator")
-    tqc = transpile(qc, backend)
-    res = backend.run(tqc, shots=shots).result()
-    counts = res.get_counts(qc)
-
-    total = sum(counts.values())
-    top = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:8]
-    log_file.write(f"[Grover] N={N} K={K} r={r} shots={shots}\n")
-    for s, c in top:
-        frac = c / total if total else 0.0
-        log_file.write(f"[Grover] {s} : {c} ({frac:.3f})\n")
+    desc = f"[Grover] r={r} iterations"
+    for _ in progress(range(r), description=desc):
+        qc.append(G, qr_data)
+
+    # no measurements: one deterministic run instead of sampling shots;
+    # Aer returns {data value: probability}, no statevector copy
+    qc.save_probabilities_dict(qr_data, label="p")
+
+    tqc = transpile(qc, backend, optimization_level=0)
+    res = backend.run(tqc).result()
+    probs = res.data(0)["p"]
+
+    counts = np.zeros(N, dtype=np.int64)
+    for i, p in probs.items():
+        counts[i] = round(p * shots)
+    metadata = res.results[0].metadata
+    fusion = metadata.get("fusion", {})
+
+    total = int(counts.sum())
+    lines = [
+        f"[Grover] N={N} K={K} r={r} shots={shots}\n",
+        f"[Grover] fusion applied={fusion.get('applied', False)}  "
+        f"method={metadata.get('method')}  precision={backend.options.precision}  "
+        f"device={backend.options.device}\n",
+    ]
+    for i in top_k(counts):
+        frac = counts[i] / total if total else 0.0
+        lines.append(f"[Grover] {format(i, f'0{n_data}b')} : {counts[i]} ({frac:.3f})\n")
+    log_file.writelines(lines)
 
     return counts
 
-def main():
-    n_data = 3        
-    shots = 4096        # qasm shots for Grover
+def main(K: Optional[int] = SPEC_K):
+    """
+    K defaults to the analytic count for oracle.py's spec; pass K=None
+    to estimate it with Quantum Counting instead
+    """
+    n_data = 3
+    shots = 4096        # counts scale for Grover
     os.makedirs("logs", exist_ok=True)
 
-    oracle = makeOracle()
+    oracle = cached_oracle()
 
     with open("logs/counting_grover.log", "w") as log:
         log.write("[Init] counting_grover start\n")
 
-        K = estimate_K_classical(oracle, n_data, log)
+        if K is None:
+            K = estimate_K_quantum(oracle, n_data, log)
         N = 1 << n_data
         r = max(1, int(math.floor((math.pi / 4.0) * math.sqrt(N / K)))) if K > 0 else 0
         log.write(f"[K] N={N} n={n_data} K={K} r={r}\n")
@@ -168,16 +290,18 @@ def main():
 
         counts = grover_search(oracle, n_data, K, shots, log)
 
-        items: List[Tuple[str,int]] = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+        # dense counts indexed by z; top-k and set checks stay on ints
+        top_idx = top_k(counts, 8)
         log.write(f"N={N}  n={n_data}  K={K}  r≈{r}  shots={shots}\n")
         log.write("Top outcomes (bitstrings as z2 z1 z0):\n")
-        for s, c in items[:8]:
-            log.write(f"  {s} : {c}\n")
-
-        expected_unsafe = {"110", "101"}
-        top_set = set(s for s,_ in items[:4])
-        log.write(f"Expected unsafe: {expected_unsafe}\n")
-        log.write(f"Top-4 found    : {top_set}\n")
+        for i in top_idx:
+            log.write(f"  {format(i, f'0{n_data}b')} : {counts[i]}\n")
+
+        expected_unsafe = {0b110, 0b101}
+        top_set = set(int(i) for i in top_idx[:4])
+        log.write(f"Expected unsafe: {set(format(z, f'0{n_data}b') for z in expected_unsafe)}\n")
+        log.write(f"Top-4 found    : {set(format(z, f'0{n_data}b') for z in top_set)}\n")
+        log.write(f"All found      : {expected_unsafe <= top_set}\n")
 
         log.write("[Done] counting_grover end\n")
 
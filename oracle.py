@@ -1,32 +1,26 @@
 # oracle
 from qiskit import QuantumCircuit
 from qiskit.visualization import circuit_drawer
-from qiskit.circuit.library import MCXGate
 import os
 '''
-    spec(z) = (z2 ∧ z1 ∧ ¬z0)  OR  (z2 ∧ ¬z1 ∧ z0)
-    qubit mapping: q[0]=z0, q[1]=z1, q[2]=z2, q[3]=ancilla
+    spec(z) = (z2 ∧ z1 ∧ ¬z0)  OR  (z2 ∧ ¬z1 ∧ z0)  =  z2 ∧ (z1 ⊕ z0)
+    qubit mapping: q[0]=z0, q[1]=z1, q[2]=z2
 
     multiply |z2 z1 z0⟩ by -1 iff spec(z)=1.
 '''
+# z2=1 and z1≠z0: |110⟩ and |101⟩
+SPEC_K = 2
+
 def makeOracle() -> QuantumCircuit:
-    qc = QuantumCircuit(4, name="O_spec")
+    qc = QuantumCircuit(3, name="O_spec")
     """
-    X|-> = -|->, a CCX targeting this ancilla 
-    implements a phase flip (−1) exactly when its 
-    controls are satisfied
+    spec is diagonal: diag(+1,+1,+1,+1,+1,-1,-1,+1).
+    CZ(q2,q1) flips |110⟩,|111⟩ and CZ(q2,q0) flips |101⟩,|111⟩;
+    |111⟩ is flipped twice, so only |110⟩ and |101⟩ pick up -1.
+    No ancilla needed
     """
-    qc.x(3)
-    qc.h(3)
-    mcx3 = MCXGate(3)  # 3-control X gate
-    qc.x(0)                    
-    qc.append(mcx3, [2, 1, 0, 3])
-    qc.x(0)                    
-    qc.x(1)                    
-    qc.append(mcx3, [2, 1, 0, 3])
-    qc.x(1)                   
-    qc.h(3)
-    qc.x(3)
+    qc.cz(2, 1)
+    qc.cz(2, 0)
     return qc
 
 def save_png_mpl(filename: str = "circuit_models/oracle.png") -> None:
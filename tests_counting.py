@@ -0,0 +1,48 @@
+from qiskit import QuantumCircuit
+from qiskit.circuit.library import DiagonalGate
+from counting_grover import estimate_K_quantum
+from oracle import SPEC_K, makeOracle
+import os
+import random
+from rich.progress import track
+
+def random_oracle(n, K, rng):
+    # phase oracle flipping K random basis states of n qubits
+    N = 1 << n
+    diag = [1] * N
+    for z in rng.sample(range(N), K):
+        diag[z] = -1
+    qc = QuantumCircuit(n, name=f"O_rand{K}")
+    qc.append(DiagonalGate(diag), range(n))
+    return qc
+
+def main():
+    rng = random.Random(2025)
+
+    # (n_data, K, oracle, n_count): the spec oracle plus random ones for n=2..5
+    cases = [(3, SPEC_K, makeOracle(), None)]
+    for n in range(2, 6):
+        N = 1 << n
+        for K in sorted(set([1, N // 4, N // 2, N - 1])):
+            cases.append((n, K, random_oracle(n, K, rng), None))
+    # mid-range K at n=5 needs more counting qubits than the default
+    cases.append((5, 12, random_oracle(5, 12, rng), 7))
+
+    # Ensure logs/ exists
+    os.makedirs("logs", exist_ok=True)
+
+    failed = []
+    with open("logs/tests_counting.log", "w") as log_file:
+            for n, K, O, t in track(cases, description="Quantum Counting"):
+                got = estimate_K_quantum(O, n, log_file, n_count=t)
+                ok = (got == K)
+                if not ok:
+                    failed.append((n, K, got))
+                log_file.write(
+                    f"n={n}  expected K={K}  got K={got}  {'ok' if ok else 'FAIL'}\n"
+                )
+
+    assert not failed, f"estimate_K_quantum mismatches (n, expected, got): {failed}"
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,7 @@ def main():
             for z in track(range(8), description=trackDesc):
                 # 3 chars for z2 z1 z0
                 zstr = bits(z, 3)
-                qc = QuantumCircuit(4)
+                qc = QuantumCircuit(3)
 
                 # Prepare |z2 z1 z0>
                 if zstr[2] == "1": qc.x(0)  # q0=z0
@@ -38,7 +38,7 @@ def main():
                      transpile(qc, sv_backend)
                      ).result().get_statevector(qc)
 
-                # index = q0 * 2^0 + q1 * 2^1 + q2 * 2^2 + q3 * 2^3
+                # index = q0 * 2^0 + q1 * 2^1 + q2 * 2^2
                 idx = (z & 0b111)
                 amp = sv[idx].real
                 sign = "-" if amp < -0.5 else "+"